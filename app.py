@@ -21,7 +21,7 @@ logger = logging.getLogger(__name__)
 sys.path.append(str(Path(__file__).parent.parent))
 
 # Import modules
-from modules.authentication import authenticate
+from modules.authentication import authenticate, ensure_fresh_token, forget_stored_tokens, restore_session
 from modules.file_browser import file_browser
 from modules.metadata_config import metadata_config
 from modules.processing import process_files
@@ -173,6 +173,11 @@ def initialize_session_state():
 # Initialize session state
 initialize_session_state()
 
+# Restore a persisted OAuth session up front so the authenticated view renders in this run
+if not st.session_state.authenticated and restore_session():
+    # A restored session starts fresh; a stale timestamp would time it out immediately
+    st.session_state.last_activity = datetime.now()
+
 # Update last activity timestamp
 def update_activity():
     st.session_state.last_activity = datetime.now()
@@ -207,6 +212,8 @@ with st.sidebar:
             st.warning("Your session has timed out due to inactivity. Please log in again.")
             st.session_state.authenticated = False
             st.session_state.client = None
+            st.session_state._config_ready = None # Auth state changed
+            forget_stored_tokens() # Otherwise restore_session() logs the user straight back in
             # Use callback for navigation on timeout to ensure rerun
             st.button("Login Again", on_click=navigate_to, args=("Home",), key="timeout_login_btn")
             st.rerun() # Force stop rendering the rest of the page
@@ -281,6 +288,8 @@ with st.sidebar:
         if st.button("Logout", use_container_width=True, key="nav_logout"):
             st.session_state.authenticated = False
             st.session_state.client = None
+            st.session_state._config_ready = None # Auth state changed
+            forget_stored_tokens()
             navigate_to("Home") # Use navigate_to to reset page
             st.rerun()
     
@@ -306,6 +315,10 @@ else:
     # Update activity timestamp (already done by navigate_to or check_session_timeout)
     # update_activity() # Redundant here
     
+    # Refresh the OAuth token before any page issues Box API calls
+    if st.session_state.client:
+        ensure_fresh_token(st.session_state.client)
+
     # Retrieve metadata templates if needed (no change here)
     if st.session_state.authenticated and st.session_state.client:
         if not st.session_state.metadata_templates:
@@ -9,8 +9,6 @@
 import streamlit as st
 import logging
 import json
-from boxsdk import Client, exception
-from boxsdk.object.metadata import MetadataUpdate # Import MetadataUpdate
 from dateutil import parser
 from datetime import timezone
 
@@ -41,6 +39,8 @@ def get_template_schema(client, full_scope, template_key):
     Returns:
         dict: A dictionary mapping field keys to their types, or None if error.
     """
+    # Imported lazily so loading this page module does not pull boxsdk into cold start
+    from boxsdk import exception
     cache_key = f'{full_scope}_{template_key}' 
     if cache_key in st.session_state.template_schema_cache:
         logger.info(f"Using cached schema for {full_scope}/{template_key}")
@@ -180,6 +180,7 @@ def parse_template_id(template_id_full):
     return full_scope, template_key
 
 def apply_metadata_to_file_direct_worker(client, file_id, file_name, metadata_values, full_scope, template_key):
+    from boxsdk import exception
     logger.info(f"Starting metadata application for file ID {file_id} ({file_name}) with template {full_scope}/{template_key}")
     
     try:
@@ -99,11 +99,7 @@ def document_categorization():
             "ibm__llama_3_2_90b_vision_instruct", "ibm__llama_4_scout"
         ]
         ai_models_with_desc = {name: all_models_with_desc.get(name, f"{name} (Description not found)")
-                               for name in allowed_model_names if name in all_models_with_desc}
-        for name in allowed_model_names:
-            if name not in ai_models_with_desc:
-                 ai_models_with_desc[name] = f"{name} (Description not found)"
-                 logger.warning(f"Model \t{name}\t from allowed list was missing description, added placeholder.")
+                               for name in allowed_model_names}
         ai_model_names = list(ai_models_with_desc.keys())
         ai_model_options = list(ai_models_with_desc.values())
         if "categorization_ai_model" not in st.session_state:
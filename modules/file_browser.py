@@ -44,6 +44,7 @@ def file_browser():
             if file["id"] == file_id:
                 # Remove file from selection
                 st.session_state.selected_files.pop(i)
+                st.session_state._config_ready = None # Selection changed
                 return
         
         # Add file to selection
@@ -52,6 +53,7 @@ def file_browser():
             "name": file_name,
             "type": file_type
         })
+        st.session_state._config_ready = None # Selection changed
     
     # Display breadcrumb navigation
     st.write("#### Location")
@@ -147,6 +149,7 @@ def file_browser():
             with col1:
                 if st.button("❌", key=f"remove_{file['id']}"):
                     st.session_state.selected_files.pop(i)
+                    st.session_state._config_ready = None # Selection changed
                     st.rerun()
             with col2:
                 st.write(f"**{file['name']}**")
@@ -156,6 +159,7 @@ def file_browser():
         # Clear selection button
         if st.button("Clear Selection"):
             st.session_state.selected_files = []
+            st.session_state._config_ready = None # Selection changed
             st.rerun()
     else:
         st.info("No files selected. Browse and select files for metadata extraction.")
@@ -1,49 +1,175 @@
 import streamlit as st
 import logging
 import json
+import pandas as pd
 from typing import Dict, Any, List, Optional
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, 
-                   format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+from modules.metadata_template_retrieval import initialize_template_state
+
+# Configure logging (no-op once the app entrypoint has installed handlers)
+if not logging.getLogger().handlers:
+    logging.basicConfig(level=logging.INFO, 
+                       format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+# Static AI model catalog, built once per process rather than on every rerun
+_ALL_MODELS_WITH_DESC = {
+    "google__gemini_2_0_flash_lite_preview": "Google Gemini 2.0 Flash Lite: Lightweight multimodal model (Default for Box AI Extract) (Preview)",
+    "azure__openai__gpt_4o_mini": "Azure OpenAI GPT-4o Mini: Lightweight multimodal model",
+    "azure__openai__gpt_4_1_mini": "Azure OpenAI GPT-4.1 Mini: Lightweight multimodal model (Default for some Box AI features)",
+    "azure__openai__gpt_4_1": "Azure OpenAI GPT-4.1: Highly efficient multimodal model for complex tasks",
+    "google__gemini_2_0_flash_001": "Google Gemini 2.0 Flash: Optimal for high-volume, high-frequency tasks",
+    "google__gemini_1_5_flash_001": "Google Gemini 1.5 Flash: High volume tasks & latency-sensitive applications",
+    "google__gemini_1_5_pro_001": "Google Gemini 1.5 Pro: Foundation model for various multimodal tasks",
+    "aws__claude_3_haiku": "AWS Claude 3 Haiku: Tailored for various language tasks",
+    "aws__claude_3_sonnet": "AWS Claude 3 Sonnet: Advanced language tasks, comprehension & context handling",
+    "aws__claude_3_5_sonnet": "AWS Claude 3.5 Sonnet: Enhanced language understanding and generation",
+    "aws__claude_3_7_sonnet": "AWS Claude 3.7 Sonnet: Enhanced language understanding and generation",
+    "aws__titan_text_lite": "AWS Titan Text Lite: Advanced language processing, extensive contexts",
+    "ibm__llama_3_2_90b_vision_instruct": "IBM Llama 3.2 90B Vision Instruct: Instruction-tuned vision model",
+    "ibm__llama_4_scout": "IBM Llama 4 Scout: Natively multimodal model for text and multimodal experiences",
+}
+_ALLOWED_MODEL_NAMES = tuple(_ALL_MODELS_WITH_DESC)
+_AI_MODEL_OPTIONS = tuple(_ALL_MODELS_WITH_DESC[name] for name in _ALLOWED_MODEL_NAMES)
+_DESC_TO_NAME = {desc: name for name, desc in _ALL_MODELS_WITH_DESC.items()}
+_MODEL_NAME_TO_INDEX = {name: i for i, name in enumerate(_ALLOWED_MODEL_NAMES)}
+
+_NOT_AUTHENTICATED_MSG = "Please authenticate with Box first"
+_NO_FILES_SELECTED_MSG = "No files selected. Please select files in the File Browser first."
+
+# Static widget options (tuples: immutable and allocated once)
+_EXTRACTION_METHODS = ("Freeform", "Structured")
+
+# Custom field types offered in the structured extraction editor
+_FIELD_TYPES = ("string", "number", "date", "enum")
+_FIELD_TYPE_INDEX = {field_type: i for i, field_type in enumerate(_FIELD_TYPES)}
+
+@st.cache_data(show_spinner=False)
+def _categorization_frame(categorization_rows):
+    """
+    Build the categorization results table from (file name, document type) pairs.
+    """
+    return pd.DataFrame(categorization_rows, columns=["File Name", "Document Type"])
+
+def _store_doc_type_prompt(doc_type, widget_key):
+    """Copy an edited per-type prompt from its widget into metadata_config."""
+    st.session_state.metadata_config["document_type_prompts"][doc_type] = st.session_state[widget_key]
+
+def _store_doc_type_template(doc_type, widget_key, template_name_to_id):
+    """Copy an edited per-type template selection from its widget into document_type_to_template."""
+    st.session_state.document_type_to_template[doc_type] = template_name_to_id.get(st.session_state[widget_key], "")
+
+@st.fragment
+def _doc_type_prompts(document_types):
+    """
+    Render one freeform prompt per document type.
+    Runs as a fragment so editing a prompt only reruns this section.
+    Widget keys mirror the metadata_config path; values are seeded once and synced on change.
+    """
+    st.subheader("Document Type Specific Prompts")
+    st.info("You can customize the freeform prompt for each document type.")
+    if "document_type_prompts" not in st.session_state.metadata_config:
+        st.session_state.metadata_config["document_type_prompts"] = {}
+    doc_type_prompts = st.session_state.metadata_config["document_type_prompts"]
+    for doc_type in document_types:
+        widget_key = f"metadata_config.document_type_prompts.{doc_type}"
+        if widget_key not in st.session_state:
+            initial_prompt = doc_type_prompts.get(doc_type, st.session_state.metadata_config.get("freeform_prompt", ""))
+            doc_type_prompts[doc_type] = initial_prompt
+            st.session_state[widget_key] = initial_prompt
+        st.text_area(
+            f"Prompt for {doc_type}",
+            height=100,
+            key=widget_key,
+            on_change=_store_doc_type_prompt,
+            args=(doc_type, widget_key),
+            help=f"Customize the prompt for {doc_type} documents"
+        )
+
+@st.fragment
+def _doc_type_template_mapping(document_types, template_options, template_display_names,
+                               template_name_to_id, template_id_to_index):
+    """
+    Render one template selectbox per document type.
+    Runs as a fragment so changing a mapping only reruns this section.
+    Widget keys mirror the document_type_to_template path; values are seeded once and synced on change.
+    """
+    st.subheader("Document Type Template Mapping")
+    st.info("You can map each document type to a specific metadata template.")
+    for doc_type in document_types:
+        widget_key = f"document_type_to_template.{doc_type}"
+        # Seed on first render, or when a template refresh removed the selected name
+        if st.session_state.get(widget_key) not in template_name_to_id:
+            selected_index = template_id_to_index.get(st.session_state.document_type_to_template.get(doc_type), 0)
+            st.session_state.document_type_to_template[doc_type] = template_options[selected_index][0]
+            st.session_state[widget_key] = template_display_names[selected_index]
+        st.selectbox(
+            f"Template for {doc_type}",
+            options=template_display_names,
+            key=widget_key,
+            on_change=_store_doc_type_template,
+            args=(doc_type, widget_key, template_name_to_id),
+            help=f"Select a metadata template for {doc_type} documents"
+        )
+
+def _can_configure_metadata():
+    """
+    Check the authentication and file-selection preconditions for this page.
+    The result is cached in st.session_state["_config_ready"]; the authentication
+    and file browser code reset it to None whenever that state changes.
+
+    Returns:
+        tuple: (ok, error_msg)
+    """
+    ready = st.session_state.get("_config_ready")
+    if ready is None:
+        if not st.session_state.authenticated or not st.session_state.client:
+            ready = (False, _NOT_AUTHENTICATED_MSG)
+        elif not st.session_state.selected_files:
+            ready = (False, _NO_FILES_SELECTED_MSG)
+        else:
+            ready = (True, None)
+        st.session_state["_config_ready"] = ready
+    return ready
+
 def metadata_config():
     """
     Configure metadata extraction parameters
     """
     st.title("Metadata Configuration")
     
-    if not st.session_state.authenticated or not st.session_state.client:
-        st.error("Please authenticate with Box first")
+    ready, error_msg = _can_configure_metadata()
+    if not ready and error_msg == _NOT_AUTHENTICATED_MSG:
+        st.error(error_msg)
         return
     
-    if not st.session_state.selected_files:
-        st.warning("No files selected. Please select files in the File Browser first.")
+    if not ready:
+        st.warning(error_msg)
         if st.button("Go to File Browser", key="go_to_file_browser_button_config"):
             st.session_state.current_page = "File Browser"
             st.rerun()
         return
     
     has_categorization = (
-        hasattr(st.session_state, "document_categorization") and 
+        "document_categorization" in st.session_state and 
         st.session_state.document_categorization.get("is_categorized", False)
     )
     
     if has_categorization:
+        categorization_results = st.session_state.document_categorization["results"]
+        # Built once for both extraction branches; sorted so per-type widgets keep a stable
+        # order across reruns (set iteration order is not guaranteed)
+        document_types = tuple(sorted({r["document_type"] for r in categorization_results.values()}))
+
         st.subheader("Document Categorization Results")
-        categorization_data = []
-        for file in st.session_state.selected_files:
-            file_id = file["id"]
-            file_name = file["name"]
-            document_type = "Not categorized"
-            if file_id in st.session_state.document_categorization["results"]:
-                document_type = st.session_state.document_categorization["results"][file_id]["document_type"]
-            categorization_data.append({
-                "File Name": file_name,
-                "Document Type": document_type
-            })
-        st.table(categorization_data)
+        # Rows are cheap to build; _categorization_frame caches the DataFrame by content
+        categorization_rows = tuple(
+            (file["name"], categorization_results[file["id"]]["document_type"]
+             if file["id"] in categorization_results else "Not categorized")
+            for file in st.session_state.selected_files
+        )
+        # st.dataframe ships Arrow instead of re-serializing a list of dicts on every rerun
+        st.dataframe(_categorization_frame(categorization_rows), hide_index=True, use_container_width=True)
     else:
         st.info("Document categorization has not been performed. You can categorize documents in the Document Categorization page.")
         if st.button("Go to Document Categorization", key="go_to_doc_cat_button"):
@@ -55,12 +181,11 @@ def metadata_config():
     if "extraction_method" not in st.session_state.metadata_config:
         st.session_state.metadata_config["extraction_method"] = "freeform"
         
-    extraction_method_options = ["Freeform", "Structured"]
     current_extraction_method_index = 0 if st.session_state.metadata_config["extraction_method"] == "freeform" else 1
     
     extraction_method = st.radio(
         "Select extraction method",
-        extraction_method_options,
+        _EXTRACTION_METHODS,
         index=current_extraction_method_index,
         key="extraction_method_radio",
         help="Choose between freeform extraction (free text) or structured extraction (with template)"
@@ -84,7 +209,8 @@ def metadata_config():
             st.session_state.metadata_config["use_template"] = False
             logger.info("Extraction method changed to Structured. User needs to select a template.")
 
-    if st.session_state.metadata_config["extraction_method"] == "freeform":
+    is_freeform = st.session_state.metadata_config["extraction_method"] == "freeform"
+    if is_freeform:
         st.subheader("Freeform Extraction Configuration")
         # Automatically set template_id to global_properties if it's freeform and not already set (e.g. on first load of page with freeform default)
         if st.session_state.metadata_config.get("template_id") != "global_properties":
@@ -94,101 +220,54 @@ def metadata_config():
 
         st.caption("Freeform extraction will use the `global_properties` metadata template by default.")
 
-        freeform_prompt = st.text_area(
-            "Freeform prompt",
-            value=st.session_state.metadata_config.get("freeform_prompt", "Extract key metadata from this document including dates, names, amounts, and other important information."),
-            height=150,
-            key="freeform_prompt_textarea",
-            help="Prompt for freeform extraction. Be specific about what metadata to extract."
-        )
-        st.session_state.metadata_config["freeform_prompt"] = freeform_prompt
-        
         if has_categorization:
-            st.subheader("Document Type Specific Prompts")
-            st.info("You can customize the freeform prompt for each document type.")
-            document_types = set()
-            for file_id, result in st.session_state.document_categorization["results"].items():
-                document_types.add(result["document_type"])
-            if "document_type_prompts" not in st.session_state.metadata_config:
-                st.session_state.metadata_config["document_type_prompts"] = {}
-            for doc_type in document_types:
-                current_prompt = st.session_state.metadata_config["document_type_prompts"].get(
-                    doc_type, st.session_state.metadata_config["freeform_prompt"]
-                )
-                doc_type_prompt = st.text_area(
-                    f"Prompt for {doc_type}",
-                    value=current_prompt,
-                    height=100,
-                    key=f"prompt_{doc_type.replace(' ', '_').lower()}",
-                    help=f"Customize the prompt for {doc_type} documents"
-                )
-                st.session_state.metadata_config["document_type_prompts"][doc_type] = doc_type_prompt
-    
+            _doc_type_prompts(document_types)
+
     else: # Structured extraction
         st.subheader("Structured Extraction Configuration")
-        if not hasattr(st.session_state, "metadata_templates") or not st.session_state.metadata_templates:
+        if not st.session_state.get("metadata_templates"):
             st.warning("No metadata templates available. Please refresh templates in the sidebar.")
             return
         
         templates = st.session_state.metadata_templates
-        template_options = [("", "None - Use custom fields")]
-        for template_id, template in templates.items():
-            template_options.append((template_id, template["displayName"]))
+        # Rebuild the options only when the templates version has changed
+        templates_version = st.session_state.get("_templates_version")
+        if (st.session_state.get("_template_options_version") == templates_version
+                and "_template_options" in st.session_state):
+            template_options = st.session_state._template_options
+            template_display_names = st.session_state._template_display_names
+            template_name_to_id = st.session_state._template_name_to_id
+            template_id_to_index = st.session_state._template_id_to_index
+        else:
+            template_options = [("", "None - Use custom fields")]
+            for template_id, template in templates.items():
+                template_options.append((template_id, template["displayName"]))
+            template_display_names = tuple(option[1] for option in template_options)
+            # Lookup maps replace per-widget linear scans (first match wins, as before)
+            template_name_to_id = {name: tid for tid, name in reversed(template_options)}
+            template_id_to_index = {tid: i for i, (tid, _) in reversed(list(enumerate(template_options)))}
+            st.session_state._template_options = template_options
+            st.session_state._template_display_names = template_display_names
+            st.session_state._template_name_to_id = template_name_to_id
+            st.session_state._template_id_to_index = template_id_to_index
+            st.session_state._template_options_version = templates_version
         
         st.write("#### Select Metadata Template")
         
-        if has_categorization:
-            st.subheader("Document Type Template Mapping")
-            st.info("You can map each document type to a specific metadata template.")
-            document_types = set()
-            for file_id, result in st.session_state.document_categorization["results"].items():
-                document_types.add(result["document_type"])
-            if not hasattr(st.session_state, "document_type_to_template"):
-                from modules.metadata_template_retrieval import initialize_template_state
-                initialize_template_state()
-            for doc_type in document_types:
-                current_template_id = st.session_state.document_type_to_template.get(doc_type)
-                selected_index = 0
-                for i, (template_id, _) in enumerate(template_options):
-                    if template_id == current_template_id:
-                        selected_index = i
-                        break
-                selected_template_name_dt = st.selectbox(
-                    f"Template for {doc_type}",
-                    options=[option[1] for option in template_options],
-                    index=selected_index,
-                    key=f"template_{doc_type.replace(' ', '_').lower()}",
-                    help=f"Select a metadata template for {doc_type} documents"
-                )
-                selected_template_id_dt = ""
-                for template_id, template_name in template_options:
-                    if template_name == selected_template_name_dt:
-                        selected_template_id_dt = template_id
-                        break
-                st.session_state.document_type_to_template[doc_type] = selected_template_id_dt
-        
-        # General template selection for structured
+        # General template selection for structured (outside the form: it decides what is shown below)
         # Find current index for general template selection
         current_general_template_id = st.session_state.metadata_config.get("template_id", "")
-        general_selected_index = 0
-        for i, (id_val, _) in enumerate(template_options):
-            if id_val == current_general_template_id:
-                general_selected_index = i
-                break
+        general_selected_index = template_id_to_index.get(current_general_template_id, 0)
 
         selected_template_name = st.selectbox(
             "Select a metadata template (for all files if not mapped by type)",
-            options=[option[1] for option in template_options],
+            options=template_display_names,
             index=general_selected_index, # Use the found index
             key="template_selectbox",
             help="Select a metadata template to use for structured extraction. This is a fallback if no type-specific template is mapped."
         )
         
-        selected_template_id = ""
-        for template_id, template_name in template_options:
-            if template_name == selected_template_name:
-                selected_template_id = template_id
-                break
+        selected_template_id = template_name_to_id.get(selected_template_name, "")
         
         st.session_state.metadata_config["template_id"] = selected_template_id
         st.session_state.metadata_config["use_template"] = (selected_template_id != "")
@@ -206,72 +285,83 @@ def metadata_config():
             st.write("Define custom fields for structured extraction")
             if "custom_fields" not in st.session_state.metadata_config:
                 st.session_state.metadata_config["custom_fields"] = []
-            for i, field in enumerate(st.session_state.metadata_config["custom_fields"]):
+            custom_fields = st.session_state.metadata_config["custom_fields"]
+            to_delete = set()
+            for i, field in enumerate(custom_fields):
                 col1, col2, col3 = st.columns([3, 2, 1])
                 with col1:
                     field_name = st.text_input("Field Name", value=field["name"], key=f"field_name_{i}", help="Name of the custom field")
                 with col2:
-                    field_type = st.selectbox("Field Type", options=["string", "number", "date", "enum"], index=["string", "number", "date", "enum"].index(field["type"]), key=f"field_type_{i}", help="Type of the custom field")
+                    field_type = st.selectbox("Field Type", options=_FIELD_TYPES, index=_FIELD_TYPE_INDEX[field["type"]], key=f"field_type_{i}", help="Type of the custom field")
                 with col3:
                     if st.button("Remove", key=f"remove_field_{i}"):
-                        st.session_state.metadata_config["custom_fields"].pop(i)
-                        st.rerun()
-                st.session_state.metadata_config["custom_fields"][i]["name"] = field_name
-                st.session_state.metadata_config["custom_fields"][i]["type"] = field_type
+                        to_delete.add(i)
+                # Only write back edited values
+                if field_name != field["name"]:
+                    field["name"] = field_name
+                if field_type != field["type"]:
+                    field["type"] = field_type
+            # Deferred deletion keeps indices stable during the render pass
+            if to_delete:
+                custom_fields[:] = [f for j, f in enumerate(custom_fields) if j not in to_delete]
+                st.rerun()
             if st.button("Add Field", key="add_field_button"):
-                st.session_state.metadata_config["custom_fields"].append({"name": f"Field {len(st.session_state.metadata_config['custom_fields']) + 1}", "type": "string"})
+                custom_fields.append({"name": f"Field {len(custom_fields) + 1}", "type": "string"})
                 st.rerun()
-    
-    st.subheader("AI Model Selection")
-    all_models_with_desc = {
-        "google__gemini_2_0_flash_lite_preview": "Google Gemini 2.0 Flash Lite: Lightweight multimodal model (Default for Box AI Extract) (Preview)",
-        "azure__openai__gpt_4o_mini": "Azure OpenAI GPT-4o Mini: Lightweight multimodal model",
-        "azure__openai__gpt_4_1_mini": "Azure OpenAI GPT-4.1 Mini: Lightweight multimodal model (Default for some Box AI features)",
-        "azure__openai__gpt_4_1": "Azure OpenAI GPT-4.1: Highly efficient multimodal model for complex tasks",
-        "google__gemini_2_0_flash_001": "Google Gemini 2.0 Flash: Optimal for high-volume, high-frequency tasks",
-        "google__gemini_1_5_flash_001": "Google Gemini 1.5 Flash: High volume tasks & latency-sensitive applications",
-        "google__gemini_1_5_pro_001": "Google Gemini 1.5 Pro: Foundation model for various multimodal tasks",
-        "aws__claude_3_haiku": "AWS Claude 3 Haiku: Tailored for various language tasks",
-        "aws__claude_3_sonnet": "AWS Claude 3 Sonnet: Advanced language tasks, comprehension & context handling",
-        "aws__claude_3_5_sonnet": "AWS Claude 3.5 Sonnet: Enhanced language understanding and generation",
-        "aws__claude_3_7_sonnet": "AWS Claude 3.7 Sonnet: Enhanced language understanding and generation",
-        "aws__titan_text_lite": "AWS Titan Text Lite: Advanced language processing, extensive contexts",
-        "ibm__llama_3_2_90b_vision_instruct": "IBM Llama 3.2 90B Vision Instruct: Instruction-tuned vision model",
-        "ibm__llama_4_scout": "IBM Llama 4 Scout: Natively multimodal model for text and multimodal experiences",
-    }
-    allowed_model_names = list(all_models_with_desc.keys())
-    model_display_names = [all_models_with_desc[name] for name in allowed_model_names]
-    current_model = st.session_state.metadata_config.get("ai_model", "google__gemini_2_0_flash_lite_preview")
-    try:
-        current_model_index = allowed_model_names.index(current_model)
-    except ValueError:
-        current_model_index = 0 # Default to first model if current is not in list
-        st.session_state.metadata_config["ai_model"] = allowed_model_names[0]
 
-    selected_model_display_name = st.selectbox(
-        "Select AI Model",
-        options=model_display_names,
-        index=current_model_index,
-        key="ai_model_selectbox",
-        help="Choose the AI model for metadata extraction. Availability may vary."
-    )
-    selected_model_name = allowed_model_names[model_display_names.index(selected_model_display_name)]
-    st.session_state.metadata_config["ai_model"] = selected_model_name
+        if has_categorization:
+            if "document_type_to_template" not in st.session_state:
+                initialize_template_state()
+            _doc_type_template_mapping(document_types, template_options, template_display_names,
+                                       template_name_to_id, template_id_to_index)
 
-    st.subheader("Batch Processing Configuration")
-    batch_size = st.number_input(
-        "Batch Size for Processing",
-        min_value=1,
-        max_value=100,
-        value=st.session_state.metadata_config.get("batch_size", 5),
-        step=1,
-        key="batch_size_number_input",
-        help="Number of files to process in each batch. Adjust based on API limits and performance."
-    )
-    st.session_state.metadata_config["batch_size"] = batch_size
+    # Widgets inside the form only rerun the script when the form is submitted;
+    # their values are copied into session state on submit
+    with st.form("metadata_config_form"):
+        if is_freeform:
+            freeform_prompt = st.text_area(
+                "Freeform prompt",
+                value=st.session_state.metadata_config.get("freeform_prompt", "Extract key metadata from this document including dates, names, amounts, and other important information."),
+                height=150,
+                key="freeform_prompt_textarea",
+                help="Prompt for freeform extraction. Be specific about what metadata to extract."
+            )
 
-    st.markdown("--- ")
-    if st.button("Save Configuration and Proceed to Process Files", key="save_config_button", use_container_width=True):
-        st.session_state.current_page = "Process Files"
-        st.rerun()
+        st.subheader("AI Model Selection")
+        current_model = st.session_state.metadata_config.get("ai_model", "google__gemini_2_0_flash_lite_preview")
+        current_model_index = _MODEL_NAME_TO_INDEX.get(current_model)
+        if current_model_index is None:
+            current_model_index = 0 # Default to first model if current is not in list
+            st.session_state.metadata_config["ai_model"] = _ALLOWED_MODEL_NAMES[0]
 
+        selected_model_display_name = st.selectbox(
+            "Select AI Model",
+            options=_AI_MODEL_OPTIONS,
+            index=current_model_index,
+            key="ai_model_selectbox",
+            help="Choose the AI model for metadata extraction. Availability may vary."
+        )
+
+        st.subheader("Batch Processing Configuration")
+        batch_size = st.number_input(
+            "Batch Size for Processing",
+            min_value=1,
+            max_value=100,
+            value=st.session_state.metadata_config.get("batch_size", 5),
+            step=1,
+            key="batch_size_number_input",
+            help="Number of files to process in each batch. Adjust based on API limits and performance."
+        )
+
+        submitted = st.form_submit_button("Save Configuration", use_container_width=True)
+        proceed = st.form_submit_button("Save and Proceed to Process Files", use_container_width=True)
+
+    if submitted or proceed:
+        if is_freeform:
+            st.session_state.metadata_config["freeform_prompt"] = freeform_prompt
+        st.session_state.metadata_config["ai_model"] = _DESC_TO_NAME[selected_model_display_name]
+        st.session_state.metadata_config["batch_size"] = batch_size
+        if proceed:
+            st.session_state.current_page = "Process Files"
+            st.rerun()
+        st.success("Configuration saved.")
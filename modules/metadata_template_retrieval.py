@@ -61,6 +61,7 @@ def get_metadata_templates(client, force_refresh=False):
         # Cache templates
         st.session_state.metadata_templates = templates
         st.session_state.template_cache_timestamp = time.time()
+        bump_templates_version()
         
         logger.info(f"Retrieved {len(templates)} metadata templates")
         return templates
@@ -68,6 +69,7 @@ def get_metadata_templates(client, force_refresh=False):
     except Exception as e:
         logger.error(f"Error retrieving metadata templates: {str(e)}")
         st.session_state.metadata_templates = {}
+        bump_templates_version()
         return {}
 
 def retrieve_templates_by_scope(access_token, scope):
@@ -123,6 +125,12 @@ def retrieve_templates_by_scope(access_token, scope):
         logger.error(f"Error retrieving {scope} templates: {str(e)}")
         return []
 
+def bump_templates_version():
+    """
+    Increment the template version whenever st.session_state.metadata_templates is replaced
+    """
+    st.session_state._templates_version = st.session_state.get("_templates_version", 0) + 1
+
 def initialize_template_state():
     """
     Initialize template-related session state variables
@@ -132,6 +140,10 @@ def initialize_template_state():
         st.session_state.metadata_templates = {}
         logger.info("Initialized metadata_templates in session state")
     
+    # Template version (lets views cache data derived from the templates)
+    if not hasattr(st.session_state, "_templates_version"):
+        bump_templates_version()
+
     # Template cache timestamp
     if not hasattr(st.session_state, "template_cache_timestamp"):
         st.session_state.template_cache_timestamp = None